@@ -8,57 +8,96 @@ AVR Radiologist Alerts - monitor.py (data-scored table detector + robust column
 - Excludes "Completed Studies".
 - Infers Date, Time, Study columns by column-wise pattern frequency.
 - Counts CT/MR items into 60–89, 90–119, 120+ buckets.
-- Always writes debug artifacts: docs/debug_*.html, docs/last_page.html, docs/last_counts.csv, docs/debug_table_headers.json.
+- Writes docs/debug_*.html only on failed fetches (or always with AVR_DEBUG_DUMPS=1);
+  docs/last_page.html is rewritten only when the page changed. docs/last_counts.csv and
+  docs/debug_table_headers.json are written every run.
 - Publishes status.json for scripts/send_telegram.py.
 
 Env: AVR_USERNAME, AVR_PASSWORD, TIMEZONE (default America/New_York), FORCE_ALERT
 """
 
-import os, re, csv, json, pytz, yaml, datetime as dt
+import os, re, csv, copy, json, yaml, pickle, hashlib, datetime as dt
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 from typing import Optional, Tuple, Dict, Any, List, Set
-from collections import deque, Counter
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from operator import itemgetter
 from urllib.parse import urlsplit, urlunsplit, urljoin
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
 
 # ---------------- Config ----------------
 
 BASE_URL = "https://www.avrteleris.com/AVR"
+_BASE_SPLIT = urlsplit(BASE_URL)
+_BASE_ORIGIN = f"{_BASE_SPLIT.scheme}://{_BASE_SPLIT.netloc}"
 
+# Canonical casings only — IIS paths are case-insensitive, so the lowercase
+# variants are retried on 404 rather than probed unconditionally.
 INDEX_CANDIDATES = [
     "Index.aspx?reporttype=1",
-    "index.aspx?reporttype=1",
     "Index.aspx",
-    "index.aspx",
 ]
 
 WORKLIST_PATHS = [
     "Forms/Worklist/Worklist.aspx",
-    "Forms/Worklist/worklist.aspx",
     "Worklist.aspx",
     "Forms/PrelimReport/Worklist.aspx",
     "Forms/Results/Worklist.aspx",
-    "Forms/WorkList/WorkList.aspx",
-    "Forms/WorkList/worklist.aspx",
     "Forms/Prelim/Worklist.aspx",
 ]
 
 LOGIN_CANDIDATES = [
     "Index.aspx?reporttype=1",
-    "index.aspx?reporttype=1",
     "Login.aspx",
-    "login.aspx",
     "Forms/Login.aspx",
     "Account/Login.aspx",
     "Default.aspx",
 ]
 
 DISCOVERY_KEYWORDS = ["worklist","work list","results","report","prelim","pending"]
+_RE_DISCOVERY = re.compile("|".join(map(re.escape, DISCOVERY_KEYWORDS)))
 
 DEFAULT_TZ = "America/New_York"
 DEFAULT_THRESHOLD = 20
 UA = "Mozilla/5.0 (X11; Linux x86_64) AVR Monitor"
+PARSER = "lxml"  # BeautifulSoup backend; flip to "html.parser" if lxml is unavailable
+
+_MONTHS = {"Jan":1,"Feb":2,"Mar":3,"Apr":4,"May":5,"Jun":6,
+           "Jul":7,"Aug":8,"Sep":9,"Oct":10,"Nov":11,"Dec":12}
+_DT_RE = re.compile(r"^([A-Z][a-z]{2}) (\d{1,2}), (\d{4}) (\d{1,2}):(\d{2}):(\d{2})$")
+_CTMR_RE = re.compile(r"\b(?:CT|MRI?)\b")
+_DATE_ANY_RE = re.compile(r"[A-Z][a-z]{2} \d{1,2}, \d{4}")
+_TIME_ANY_RE = re.compile(r"\b\d{1,2}:\d{2}(:\d{2})?\b")
+_DATE_CELL_RE = re.compile(r"^[A-Z][a-z]{2} \d{1,2}, \d{4}$")
+_TIME_CELL_RE = re.compile(r"^\d{1,2}:\d{2}(:\d{2})?$")
+_REDIR_META_RE = re.compile(r"url=(.+)", re.I)
+_REDIR_JS_RE = re.compile(
+    r"location\.(?:href|replace)\(['\"]([^'\"]+)['\"]\)"
+    r"|window\.location\s*=\s*['\"]([^'\"]+)['\"]", re.I)
+
+# restrict soup construction to the subtrees each consumer actually reads;
+# ASP.NET pages are mostly ViewState/script noise the strainer never tokenizes
+_STRAINER_META = SoupStrainer("meta")
+_STRAINER_FORMS = SoupStrainer("form")
+
+_USER_FIELDS = frozenset({"username","user","userid","login","txtusername","ctl00$maincontent$txtusername"})
+_PASS_FIELDS = frozenset({"password","pwd","pass","txtpassword","ctl00$maincontent$txtpassword"})
 
 # ---------------- Helpers ----------------
 
@@ -66,23 +105,35 @@ def env_truthy(name: str, default: str = "false") -> bool:
     v = os.getenv(name, default)
     return str(v).strip().lower() in ("1","true","yes","y","on")
 
+@lru_cache(maxsize=4)
+def _tz(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
 def now_in_tz(tzname: str) -> dt.datetime:
-    tz = pytz.timezone(tzname)
-    return dt.datetime.now(tz)
+    return dt.datetime.now(_tz(tzname))
+
+# allowed minutes-since-midnight per weekday: Mon–Fri 6p–11:59p, Sat 4a–11:59p, Sun until 9p
+_WINDOWS = ((18*60, 23*60+59),) * 5 + ((4*60, 23*60+59), (0, 21*60))
 
 def allowed_window(now_local: dt.datetime) -> bool:
-    wd = now_local.weekday()
-    t = now_local.time()
-    def between(a: dt.time, b: dt.time) -> bool: return a <= t <= b
-    if 0 <= wd <= 4:  # Mon–Fri 6p–11:59:59p
-        return between(dt.time(18,0), dt.time(23,59,59))
-    if wd == 5:      # Sat 4a–11:59:59p
-        return between(dt.time(4,0), dt.time(23,59,59))
-    return between(dt.time(0,0), dt.time(21,0))  # Sun until 9p
+    m = now_local.hour*60 + now_local.minute
+    lo, hi = _WINDOWS[now_local.weekday()]
+    return lo <= m <= hi
+
+# parsed YAML keyed by path, validated by (mtime, size); callers get copies
+# so mutating a returned config can't poison the cache
+_YAML_CACHE: Dict[str, Tuple[float, int, Any]] = {}
 
 def read_yaml(path: str, default: Any) -> Any:
     try:
-        with open(path,"r",encoding="utf-8") as f: return yaml.safe_load(f) or default
+        st = os.stat(path)
+        hit = _YAML_CACHE.get(path)
+        if hit is not None and hit[0] == st.st_mtime and hit[1] == st.st_size:
+            return copy.deepcopy(hit[2]) or default
+        with open(path,"r",encoding="utf-8") as f:
+            data = yaml.load(f, Loader=_YamlLoader)
+        _YAML_CACHE[path] = (st.st_mtime, st.st_size, data)
+        return copy.deepcopy(data) or default
     except Exception: return default
 
 def safe_write_text(path: str, text: str):
@@ -90,52 +141,631 @@ def safe_write_text(path: str, text: str):
     with open(path,"w",encoding="utf-8") as f: f.write(text or "")
 
 def safe_write_status(status: Dict[str,Any]):
-    with open("status.json","w",encoding="utf-8") as f: json.dump(status,f,indent=2,ensure_ascii=False)
+    # status.json is machine-read by send_telegram.py; compact by default,
+    # pretty-printed only when DEBUG_JSON is set for human inspection
+    pretty = bool(os.getenv("DEBUG_JSON"))
+    if orjson is not None:
+        data = orjson.dumps(status, option=orjson.OPT_INDENT_2 if pretty else 0)
+    else:
+        data = json.dumps(status, ensure_ascii=False,
+                          indent=2 if pretty else None,
+                          separators=None if pretty else (",",":")).encode("utf-8")
+    # write-then-rename so a crash mid-write can't leave a truncated file
+    # for the telegram step to choke on
+    with open("status.json.tmp","wb") as f: f.write(data)
+    os.replace("status.json.tmp", "status.json")
 
+@lru_cache(maxsize=128)
 def _abs_url(base: str, path: str) -> str:
     if path.startswith(("http://","https://")): return path
     if path.startswith("/"):
+        if base == BASE_URL: return _BASE_ORIGIN + path
         sp = urlsplit(base)
         return urlunsplit((sp.scheme, sp.netloc, path, "", ""))
     return f"{base.rstrip('/')}/{path.lstrip('/')}"
 
 def _same_origin(base: str, url: str) -> bool:
+    # every caller passes BASE_URL in practice; a prefix check against the
+    # precomputed origin avoids building two SplitResults per BFS link
+    if base == BASE_URL:
+        return url == _BASE_ORIGIN or url.startswith(_BASE_ORIGIN + "/")
     a, b = urlsplit(base), urlsplit(url)
     return (a.scheme, a.netloc) == (b.scheme, b.netloc)
 
 def _extract_meta_js_redirect(html: str) -> Optional[str]:
     if not html: return None
-    soup = BeautifulSoup(html, "html.parser")
+    # most pages carry no redirect at all; a substring scan over the head of
+    # the page (redirects live in <head> or an early inline script) is far
+    # cheaper than building a soup just to learn that
+    low = html[:4096].lower()
+    if "http-equiv" not in low and "location" not in low:
+        return None
+    soup = BeautifulSoup(html, PARSER, parse_only=_STRAINER_META)
     for m in soup.find_all("meta"):
         if m.get("http-equiv","").lower()=="refresh":
-            mm = re.search(r"url=(.+)", m.get("content",""), re.I)
+            mm = _REDIR_META_RE.search(m.get("content",""))
             if mm: return mm.group(1).strip().strip("'\"")
-    mm = re.search(r"location\.(?:href|replace)\(['\"]([^'\"]+)['\"]\)", html, re.I)
-    if mm: return mm.group(1).strip()
-    mm = re.search(r"window\.location\s*=\s*['\"]([^'\"]+)['\"]", html, re.I)
-    if mm: return mm.group(1).strip()
+    mm = _REDIR_JS_RE.search(html)
+    if mm: return (mm.group(1) or mm.group(2)).strip()
     return None
 
+# no legitimate AVR page approaches this; a runaway body cannot blow memory
+_MAX_BODY = 8 * 1024 * 1024
+
+def _read_capped(r: requests.Response) -> requests.Response:
+    """Materialize a streamed response up to _MAX_BODY bytes.
+
+    Stores the capped bytes where requests keeps them, so .content/.text
+    behave normally downstream."""
+    try:
+        r._content = r.raw.read(_MAX_BODY, decode_content=True)
+        r._content_consumed = True
+    except Exception:
+        pass  # let requests' own lazy read take over
+    finally:
+        r.close()
+    return r
+
+def _body(r: Optional[requests.Response]) -> str:
+    """Decode a response once and memoize it; requests re-decodes on every .text access."""
+    if r is None: return ""
+    t = getattr(r, "_cached_text", None)
+    if t is None:
+        # pin a default encoding so .text never falls back to charset detection
+        try:
+            if not r.encoding: r.encoding = "utf-8"
+        except Exception: pass
+        t = getattr(r, "text", "") or ""
+        try: r._cached_text = t
+        except Exception: pass
+    return t
+
+def _soup(r: requests.Response) -> BeautifulSoup:
+    """Form-only soup of a response, parsed at most once; the login path never
+    reads anything outside <form> subtrees."""
+    s = getattr(r, "_cached_soup", None)
+    if s is None:
+        s = BeautifulSoup(_body(r), PARSER, parse_only=_STRAINER_FORMS)
+        try: r._cached_soup = s
+        except Exception: pass
+    return s
+
 def _find_login_form(soup: BeautifulSoup):
     for form in soup.find_all("form"):
         if form.find("input", {"type":"password"}): return form
     return None
 
 def _build_form_payload(form, username: str, password: str) -> Dict[str,str]:
+    # one walk over the inputs collects the payload plus the fallback
+    # user/password fields and submit buttons
     payload: Dict[str,str] = {}
+    first_text = None; first_pass = None; submits: List[Tuple[str,str]] = []
     for inp in form.find_all("input"):
-        n = inp.get("name"); 
-        if n: payload[n] = inp.get("value","")
-    def set_best(names, val):
+        n = inp.get("name")
+        if not n: continue
+        payload[n] = inp.get("value","")
+        typ = (inp.get("type") or "").lower()
+        if typ in ("text","email") and first_text is None: first_text = n
+        elif typ == "password" and first_pass is None: first_pass = n
+        elif typ in ("submit","image"): submits.append((n, inp.get("value","")))
+    lower_to_key = {k.lower(): k for k in payload}
+    def set_best(names: frozenset, val: str) -> bool:
         ok=False
         for cand in names:
-            for k in list(payload.keys()):
-                if k.lower()==cand.lower(): payload[k]=val; ok=True
+            real = lower_to_key.get(cand)
+            if real: payload[real]=val; ok=True
         return ok
-    user_set = set_best(["username","user","userid","login","txtusername","ctl00$maincontent$txtusername"], username)
-    pass_set = set_best(["password","pwd","pass","txtpassword","ctl00$maincontent$txtpassword"], password)
-    if not user_set:
-        for inp in form.find_all("input"):
-            if (inp.get("type") or "").lower() in ("text","email"):
-                n=inp.get("name"); 
-                if n: payload
+    user_set = set_best(_USER_FIELDS, username)
+    pass_set = set_best(_PASS_FIELDS, password)
+    if not user_set and first_text: payload[first_text] = username
+    if not pass_set and first_pass: payload[first_pass] = password
+    for n, v in submits:
+        if not payload.get(n): payload[n] = v or "Login"
+    return payload
+
+# ---------------- Debug artifacts ----------------
+
+# per-step dumps are pure diagnostics: with AVR_DEBUG_DUMPS set they stream
+# to disk via a small background pool; otherwise they buffer in memory and
+# only hit disk when the fetch fails (the success path writes nothing)
+_DUMPS_FORCED = env_truthy("AVR_DEBUG_DUMPS")
+_IO_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_PENDING_ARTIFACTS: List[Tuple[str,str]] = []
+
+def _submit_artifact(name: str, text: str):
+    global _IO_EXECUTOR
+    if _IO_EXECUTOR is None:
+        _IO_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+    _IO_EXECUTOR.submit(safe_write_text, f"docs/{name}", text)
+
+def _queue_artifact(name: str, text: str):
+    if _DUMPS_FORCED:
+        _submit_artifact(name, text)
+    else:
+        _PENDING_ARTIFACTS.append((name, text))
+
+def _flush_artifacts(keep: bool = False):
+    """Drain the artifact pool; with ``keep``, write the buffered dumps first."""
+    global _IO_EXECUTOR
+    if keep:
+        for name, text in _PENDING_ARTIFACTS:
+            _submit_artifact(name, text)
+    _PENDING_ARTIFACTS.clear()
+    if _IO_EXECUTOR is not None:
+        _IO_EXECUTOR.shutdown(wait=True)
+        _IO_EXECUTOR = None
+
+# ---------------- HTTP conditional-request cache ----------------
+
+_VALIDATORS_PATH = "docs/last_etag.json"
+
+def _load_validators() -> Dict[str,str]:
+    """Conditional-request headers from the previous worklist response, if any."""
+    try:
+        with open(_VALIDATORS_PATH,"r",encoding="utf-8") as f: v = json.load(f) or {}
+    except Exception:
+        return {}
+    h: Dict[str,str] = {}
+    if v.get("etag"): h["If-None-Match"] = v["etag"]
+    if v.get("last_modified"): h["If-Modified-Since"] = v["last_modified"]
+    return h
+
+def _save_validators(r: requests.Response):
+    v = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    if v["etag"] or v["last_modified"]:
+        safe_write_text(_VALIDATORS_PATH, json.dumps(v))
+
+# the ASP.NET session cookie outlives a single run by many minutes; reusing
+# the jar lets the next run skip the whole login sequence via section (A)
+_COOKIES_PATH = "docs/.avr_cookies"
+
+def _load_cookies(session: requests.Session):
+    try:
+        with open(_COOKIES_PATH,"rb") as f:
+            session.cookies.update(pickle.load(f))
+    except Exception:
+        pass
+
+def _save_cookies(session: requests.Session):
+    try:
+        os.makedirs("docs", exist_ok=True)
+        fd = os.open(_COOKIES_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(session.cookies, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        pass
+
+# the path that actually served the worklist last run; probing it first takes
+# steady-state runs from eight-path sweeps to a single hit
+_WORKLIST_PATH_CACHE = "docs/.avr_worklist_path"
+
+def _load_known_worklist_path() -> Optional[str]:
+    try:
+        with open(_WORKLIST_PATH_CACHE,"r",encoding="utf-8") as f:
+            return f.read().strip() or None
+    except Exception:
+        return None
+
+def _save_known_worklist_path(path: str):
+    safe_write_text(_WORKLIST_PATH_CACHE, path)
+
+def _cached_last_page() -> Optional[bytes]:
+    try:
+        with open("docs/last_page.html","rb") as f: return f.read()
+    except Exception:
+        return None
+
+# ---------------- Worklist detection ----------------
+
+def looks_like_worklist(html: str) -> bool:
+    if not html or len(html) < 200: return False
+    if "Study Requested" not in html: return False
+    if "Report Out Time" in html: return False
+    return True
+
+def _is_worklist_bytes(b: bytes) -> bool:
+    """looks_like_worklist on the raw body — a C-level substring scan that
+    avoids charset-decoding obvious non-worklist pages."""
+    if not b or len(b) < 200: return False
+    return b"Study Requested" in b and b"Report Out Time" not in b
+
+_LINK_ATTR = {"a": "href", "frame": "src", "iframe": "src"}
+
+def collect_links_and_frames(page_url: str, html: str) -> List[str]:
+    # link extraction needs no soup — one lxml C-level pass over the tree
+    out: List[str] = []
+    try:
+        tree = lxml.html.fromstring(html)
+    except Exception:
+        return out
+    for el in tree.iter("a", "frame", "iframe"):
+        v = (el.get(_LINK_ATTR[el.tag]) or "").strip()
+        if not v: continue
+        if v.lower().startswith(("javascript:","mailto:","#")): continue
+        u = urljoin(page_url, v).split("#")[0]
+        if _same_origin(BASE_URL, u) and u not in out: out.append(u)
+    return out
+
+def prioritize(urls: List[str]) -> List[str]:
+    # only "matches a keyword" vs "doesn't" matters, so one stable partition
+    # pass replaces the scored sort; keyword test is a single compiled scan
+    hits: List[str] = []; misses: List[str] = []
+    for u in urls:
+        (hits if _RE_DISCOVERY.search(u.lower()) else misses).append(u)
+    return hits + misses
+
+# ---------------- Worklist parsing ----------------
+
+def parse_worklist_counts(html: bytes, now_local: dt.datetime, tz,
+                          stop_at: Optional[int] = None) -> Tuple[Dict[str,int], Dict[str,Any]]:
+    """Score tables for worklist-ness, infer Date/Time/Study columns, count CT/MR into buckets.
+
+    When ``stop_at`` is given, counting stops once the bucket total reaches it —
+    the alert decision only needs total >= threshold, so reported counts become
+    a floor on long worklists."""
+    counts = {"60":0,"90":0,"120":0}
+    debug: Dict[str,Any] = {"included_rows": [], "table_headers": [], "chosen_table": None}
+    # lxml traversal runs in libxml2 C code; no BeautifulSoup wrapper objects
+    try:
+        tree = lxml.html.fromstring(html)
+    except Exception:
+        return counts, debug
+
+    # pick the table whose data rows look most like worklist entries; a table
+    # with several matching rows is accepted outright so trailing layout
+    # tables are never scanned
+    best = None; best_score = 0
+    for ti, t in enumerate(tree.iter("table")):
+        th_texts = [th.text_content().strip() for th in t.iter("th")]
+        debug["table_headers"].append(th_texts)
+        # one text_content() walk per table covers both completed-studies markers
+        tt = t.text_content()
+        if "Report Out Time" in tt or "Completed Studies" in tt: continue
+        score = 0
+        for tr in t.iter("tr"):
+            tds = tr.findall("td")
+            if len(tds) < 3: continue
+            row_text = " ".join(c.text_content().strip() for c in tds)
+            up = row_text.upper()
+            # cheap substring test culls non-CT/MR rows before the regex runs
+            if "CT" not in up and "MR" not in up: continue
+            if not _CTMR_RE.search(up): continue
+            if not _DATE_ANY_RE.search(row_text): continue
+            if not _TIME_ANY_RE.search(row_text): continue
+            score += 1
+        if score > best_score: best, best_score = (ti, t), score
+        if best_score >= 3: break
+    if best is None: return counts, debug
+    debug["chosen_table"] = best[0]
+    table = best[1]
+
+    # infer Date, Time, Study columns by column-wise pattern frequency
+    date_hits: Counter = Counter(); time_hits: Counter = Counter(); study_hits: Counter = Counter()
+    for tr in table.iter("tr"):
+        for i, c in enumerate(tr.findall("td")):
+            txt = c.text_content().strip()
+            if _DATE_CELL_RE.match(txt): date_hits[i] += 1
+            if _TIME_CELL_RE.match(txt): time_hits[i] += 1
+            up = txt.upper()
+            if ("CT" in up or "MR" in up) and _CTMR_RE.search(up): study_hits[i] += 1
+    if not (date_hits and time_hits and study_hits): return counts, debug
+    date_i = date_hits.most_common(1)[0][0]
+    time_i = time_hits.most_common(1)[0][0]
+    study_i = study_hits.most_common(1)[0][0]
+    debug["columns"] = {"date": date_i, "time": time_i, "study": study_i}
+
+    # all rows share the tz of now_local; work in naive seconds-since-day-0 so
+    # the loop subtracts plain ints instead of building timedelta objects
+    now_s = (now_local.toordinal() * 86400
+             + now_local.hour * 3600 + now_local.minute * 60 + now_local.second)
+
+    # rows cluster on a handful of distinct timestamps; parse each pair once
+    dt_cache: Dict[Tuple[str,str], Optional[int]] = {}
+
+    def parse_req_dt(date_str: str, time_str: str) -> Optional[int]:
+        key = (date_str, time_str)
+        try:
+            return dt_cache[key]
+        except KeyError:
+            pass
+        res: Optional[int] = None
+        ts = time_str if time_str.count(":") == 2 else (time_str + ":00" if time_str else "")
+        m = _DT_RE.match(f"{date_str} {ts}")
+        if m:
+            mon = _MONTHS.get(m.group(1))
+            if mon:
+                try:
+                    day = dt.date(int(m.group(3)), mon, int(m.group(2)))
+                    res = (day.toordinal() * 86400
+                           + int(m.group(4)) * 3600 + int(m.group(5)) * 60 + int(m.group(6)))
+                except ValueError:
+                    pass
+        dt_cache[key] = res
+        return res
+
+    need = max(date_i, time_i, study_i)
+    total = 0
+    for tr in table.iter("tr"):
+        tds = tr.findall("td")
+        if len(tds) <= need: continue
+        study_text = tds[study_i].text_content().strip()
+        study_upper = study_text.upper()
+        if "CT" not in study_upper and "MR" not in study_upper: continue
+        date_text = tds[date_i].text_content().strip()
+        time_text = tds[time_i].text_content().strip()
+        req_s = parse_req_dt(date_text, time_text)
+        if req_s is None: continue
+        minutes = (now_s - req_s) // 60
+        if minutes < 60: continue
+        inc = len(_CTMR_RE.findall(study_upper))
+        if not inc: continue
+        bucket = "120" if minutes >= 120 else ("90" if minutes >= 90 else "60")
+        counts[bucket] += inc
+        total += inc
+        debug["included_rows"].append({
+            "bucket": bucket, "age_min": minutes,
+            "patient": tds[0].text_content().strip(),
+            "study_cell": study_text, "ct_mr_count_in_row": inc,
+        })
+        if stop_at is not None and total >= stop_at:
+            debug["truncated"] = True
+            break
+    return counts, debug
+
+# ---------------- Login + fetch ----------------
+
+def try_login_and_fetch_worklist(session: requests.Session, base: str) -> Optional[bytes]:
+    username = os.getenv("AVR_USERNAME",""); password = os.getenv("AVR_PASSWORD","")
+    step = count(1)  # atomic in CPython; safe_get runs from pool threads during discovery
+
+    def dump(name: str, html: str, note: str = ""):
+        prefix = f"<!-- {note} -->\n" if note else ""
+        _queue_artifact(name, prefix + (html or ""))
+
+    def safe_get(url: str, name: str, headers: Optional[Dict[str,str]] = None) -> Optional[requests.Response]:
+        n = next(step)
+        try:
+            r = _read_capped(session.get(url, headers=headers, timeout=30, stream=True))
+            dump(f"debug_{n:02d}_{name}.html", _body(r), f"GET {url} -> {r.status_code}")
+            return r
+        except Exception as e:
+            dump(f"debug_{n:02d}_{name}.html", "", f"GET {url} failed: {e}")
+            return None
+
+    def safe_post(url: str, data: Dict[str,str], name: str) -> Optional[requests.Response]:
+        n = next(step)
+        try:
+            r = _read_capped(session.post(url, data=data, timeout=30, stream=True))
+            dump(f"debug_{n:02d}_{name}.html", _body(r), f"POST {url} -> {r.status_code}")
+            return r
+        except Exception as e:
+            dump(f"debug_{n:02d}_{name}.html", "", f"POST {url} failed: {e}")
+            return None
+
+    def get_follow(url: str, name: str, hops: int = 3,
+                   headers: Optional[Dict[str,str]] = None) -> Optional[requests.Response]:
+        r = safe_get(url, name, headers)
+        for _ in range(hops):
+            if r is None: return None
+            nxt = _extract_meta_js_redirect(_body(r))
+            if not nxt: break
+            nxt_url = _abs_url(base, nxt)
+            if not _same_origin(base, nxt_url): break
+            r = safe_get(nxt_url, name + "_redir")
+        return r
+
+    def get_candidate(path: str, name: str,
+                      headers: Optional[Dict[str,str]] = None) -> Optional[requests.Response]:
+        """get_follow a canonical candidate path, retrying lowercase on 404."""
+        r = get_follow(_abs_url(base, path), name, headers=headers)
+        low = path.lower()
+        if low != path and r is not None and r.status_code == 404:
+            r = get_follow(_abs_url(base, low), name, headers=headers)
+        return r
+
+    # conditional-request validators from the previous successful worklist fetch
+    cond = _load_validators()
+
+    # last run's winning path goes to the front of both probe sweeps
+    known = _load_known_worklist_path()
+    worklist_paths = ([known] + [p for p in WORKLIST_PATHS if p != known]) if known \
+                     else list(WORKLIST_PATHS)
+
+    def head_ok(url: str) -> bool:
+        """Cheap HEAD screen: skip pulling bodies that redirect to login or are
+        obviously too small to be the worklist."""
+        try:
+            h = session.head(url, allow_redirects=False, timeout=10)
+        except Exception:
+            return True  # HEAD flaky/unsupported — fall through to the GET
+        if h.status_code in (301, 302, 303, 307, 401, 403): return False
+        cl = h.headers.get("Content-Length")
+        if cl and cl.isdigit() and int(cl) < 2000: return False
+        return True
+
+    # (A) direct worklist probes — an existing cookie may still be valid
+    for path in worklist_paths[:2]:
+        # with validators a conditional GET can 304, which beats HEAD+GET;
+        # screen with HEAD only when no validators are cached
+        if not cond and not head_ok(_abs_url(base, path)): continue
+        r = get_candidate(path, "worklist_probe", headers=cond)
+        if r is None: continue
+        if r.status_code == 304:
+            cached = _cached_last_page()
+            if cached: return cached
+            continue
+        body = r.content
+        if _is_worklist_bytes(body) and (b"Logout" in body or b"Logged In:" in body):
+            _save_validators(r); _save_known_worklist_path(path)
+            return body
+        # a non-404 miss means the cookie is stale (login gate), not a wrong
+        # path — further probes would bounce the same way, so go log in
+        if r.status_code != 404: break
+
+    # (B) land on index (primes cookies, follows meta/JS redirects)
+    landed = None
+    for path in INDEX_CANDIDATES:
+        r = get_candidate(path, "index")
+        if r is not None and r.status_code == 200:
+            landed = r; break
+
+    # (C) find a login form and post credentials; the candidate GETs are
+    # independent, so fetch them all at once and examine in priority order
+    with ThreadPoolExecutor(max_workers=len(LOGIN_CANDIDATES)) as pool:
+        login_rs = list(pool.map(lambda p: get_candidate(p, "login"), LOGIN_CANDIDATES))
+    for path, r in zip(LOGIN_CANDIDATES, login_rs):
+        if r is None: continue
+        html = _body(r)
+        if "Logout" in html or "Logged In:" in html: break  # already authenticated
+        # no password input, no login form — skip the parse entirely
+        if 'type="password"' not in html and "type='password'" not in html: continue
+        form = _find_login_form(_soup(r))
+        if form is None: continue
+        payload = _build_form_payload(form, username, password)
+        action = urljoin(getattr(r,"url","") or _abs_url(base, path), (form.get("action") or "").strip())
+        pr = safe_post(action, payload, "login_post")
+        if pr is None: continue
+        phtml = _body(pr)
+        nxt = _extract_meta_js_redirect(phtml)
+        if nxt:
+            rr = get_follow(urljoin(action, nxt), "login_post_redir")
+            if rr is not None: phtml = _body(rr)
+        if looks_like_worklist(phtml):
+            return (rr if nxt and rr is not None else pr).content
+        if "Logout" in phtml or "Logged In:" in phtml: break
+
+    # (D) known worklist paths post-login
+    for path in worklist_paths:
+        r = get_candidate(path, "worklist", headers=cond)
+        if r is None: continue
+        if r.status_code == 304:
+            cached = _cached_last_page()
+            if cached: return cached
+            continue
+        if _is_worklist_bytes(r.content):
+            _save_validators(r); _save_known_worklist_path(path)
+            return r.content
+
+    # (E) auto-discovery over same-origin links/frames: level-synchronous BFS
+    # (depth 3, 60-page budget) with each level fetched concurrently — total
+    # time is bounded by levels, not by page count
+    start = getattr(landed,"url","") or _abs_url(base, INDEX_CANDIDATES[0])
+    seen: Set[str] = {start}; level = [start]; budget = 60
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for depth in range(4):
+            if not level or budget <= 0: break
+            batch = level[:budget]; budget -= len(batch)
+            nxt_level: List[str] = []
+            for url, r in zip(batch, pool.map(lambda u: safe_get(u, "discover"), batch)):
+                if r is None: continue
+                if _is_worklist_bytes(r.content):
+                    _save_validators(r)
+                    return r.content
+                if depth < 3:
+                    for u in prioritize(collect_links_and_frames(url, _body(r))):
+                        if u not in seen:
+                            seen.add(u); nxt_level.append(u)
+            level = nxt_level
+    return None
+
+# ---------------- Main ----------------
+
+def main():
+    tzname = os.getenv("TIMEZONE", DEFAULT_TZ)
+    tz = _tz(tzname)
+    now_local = now_in_tz(tzname)
+    force_alert = env_truthy("FORCE_ALERT")
+    allowed = allowed_window(now_local)
+    now_str = now_local.strftime('%Y-%m-%d %H:%M:%S')
+    print(f"[INFO] Now {now_str} {tzname}; allowed_window={allowed} force_alert={force_alert}", flush=True)
+
+    cfg = read_yaml("config.yml", {}) or {}
+    threshold = int((cfg.get("threshold") or {}).get("total_min", DEFAULT_THRESHOLD))
+    contacts_doc = read_yaml("contacts.yml", {}) or {}
+    contacts = contacts_doc.get("radiologists", []) if isinstance(contacts_doc, dict) else []
+    contact_names = [name for c in contacts if isinstance(c, dict) and (name := c.get("name"))]
+
+    status: Dict[str,Any] = {
+        "time_local": now_str,
+        "timezone": tzname,
+        "allowed_window": allowed,
+        "threshold": threshold,
+        "contacts": contact_names,
+        "counts": {"60":0,"90":0,"120":0},
+        "total_ctmr_60_90_120": 0,
+        "alert_triggered": False,
+        "error": None,
+    }
+
+    if not allowed and not force_alert:
+        print("[INFO] Outside allowed window; writing status and exiting.", flush=True)
+        safe_write_status(status)
+        return
+
+    s = requests.Session()
+    s.headers.update({
+        "User-Agent": UA,
+        "Accept": "text/html,application/xhtml+xml",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Connection": "keep-alive",
+    })
+    s.mount("https://", HTTPAdapter(
+        pool_connections=4, pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3,
+                          status_forcelist=(500,502,503,504),
+                          allowed_methods=frozenset(["GET","POST"]))))
+    _load_cookies(s)
+    html = None
+    try:
+        html = try_login_and_fetch_worklist(s, BASE_URL)
+        if html: _save_cookies(s)
+    except Exception as e:
+        status["error"] = f"fetch: {e}"
+    finally:
+        # keep the buffered step dumps only when the fetch came up empty
+        _flush_artifacts(keep=not html)
+
+    if not html:
+        status["error"] = status["error"] or "worklist not found"
+        safe_write_status(status)
+        print("[WARN] Worklist not found; see docs/debug_*.html", flush=True)
+        return
+
+    # skip rewriting the snapshot when the page is byte-identical to last run
+    # (the parse still happens: row ages depend on the current clock)
+    h = hashlib.blake2b(html, digest_size=16).hexdigest()
+    prev = None
+    try:
+        with open("docs/last_page.hash","r",encoding="utf-8") as f: prev = f.read().strip()
+    except Exception:
+        pass
+    if prev != h:
+        os.makedirs("docs", exist_ok=True)
+        with open("docs/last_page.html","wb") as f: f.write(html)
+        safe_write_text("docs/last_page.hash", h)
+    # the alert fires on total >= threshold, so stop counting there — except
+    # on forced runs (the message should report the real backlog) or when
+    # AVR_FULL_PARSE asks for an exhaustive count
+    stop_at = None if (force_alert or env_truthy("AVR_FULL_PARSE")) else threshold
+    counts, debug = parse_worklist_counts(html, now_local, tz, stop_at=stop_at)
+    total = sum(counts.values())
+    status["counts"] = counts
+    status["total_ctmr_60_90_120"] = total
+    status["counts_truncated"] = bool(debug.get("truncated"))
+    status["alert_triggered"] = bool(total >= threshold and allowed) or force_alert
+    status["included_rows"] = debug.get("included_rows", [])
+
+    safe_write_text("docs/debug_table_headers.json",
+                    json.dumps(debug.get("table_headers", []), indent=2, ensure_ascii=False))
+    os.makedirs("docs", exist_ok=True)
+    with open("docs/last_counts.csv","w",newline="",encoding="utf-8",buffering=1<<16) as f:
+        w = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
+        w.writerow(["bucket","age_min","patient","study_cell","ct_mr_count_in_row"])
+        row_fields = itemgetter("bucket","age_min","patient","study_cell","ct_mr_count_in_row")
+        w.writerows(map(row_fields, debug.get("included_rows", [])))
+
+    safe_write_status(status)
+    print(f"[INFO] counts={counts} total={total} alert={status['alert_triggered']}", flush=True)
+
+if __name__ == "__main__":
+    main()
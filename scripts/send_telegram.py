@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
 import os
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except Exception:
+    orjson = None
 
 STATUS_PATH = "status.json"
 
+def save_status(status: dict):
+    """Serialize status.json (orjson when available) and rename into place."""
+    tmp = STATUS_PATH + ".tmp"
+    if orjson is not None:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(status, option=orjson.OPT_INDENT_2))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(status, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, STATUS_PATH)
+
+# one pooled session so every sendMessage reuses the same TLS connection
+# instead of paying a fresh handshake per chat id
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
 def log(msg):
     print(f"[INFO] {msg}", flush=True)
 
@@ -55,8 +77,7 @@ def main():
             "results": [{"chat_id": cid, "sent": False, "reason": "not_triggered"} for cid in chat_ids],
             "time_utc": datetime.utcnow().isoformat() + "Z",
         })
-        with open(STATUS_PATH, "w", encoding="utf-8") as f:
-            json.dump(status, f, indent=2, ensure_ascii=False)
+        save_status(status)
         return
 
     text = (
@@ -68,25 +89,28 @@ def main():
     )
 
     api = f"https://api.telegram.org/bot{token}/sendMessage"
-    results = []
-    for cid in chat_ids:
+
+    def send_one(cid: int) -> dict:
         try:
-            r = requests.post(api, json={"chat_id": cid, "text": text, "disable_notification": False}, timeout=20)
+            r = _SESSION.post(api, json={"chat_id": cid, "text": text, "disable_notification": False}, timeout=20)
             ok = r.ok and r.json().get("ok", False)
-            results.append({"chat_id": cid, "sent": ok, "status": r.status_code, "body": r.text[:300]})
             log(f"Sent to {cid}: ok={ok} status={r.status_code}")
-            time.sleep(0.3)
+            return {"chat_id": cid, "sent": ok, "status": r.status_code, "body": r.text[:300]}
         except Exception as e:
-            results.append({"chat_id": cid, "sent": False, "error": str(e)})
             log(f"Send error for {cid}: {e}")
+            return {"chat_id": cid, "sent": False, "error": str(e)}
+
+    # fan out concurrently; a handful of chats stays far below Telegram's
+    # 30 msg/s bot limit, so no pacing sleep is needed
+    with ThreadPoolExecutor(max_workers=min(8, len(chat_ids))) as ex:
+        results = list(ex.map(send_one, chat_ids))
 
     status.setdefault("notification", {}).setdefault("telegram", {}).update({
         "recipients": chat_ids,
         "results": results,
         "time_utc": datetime.utcnow().isoformat() + "Z",
     })
-    with open(STATUS_PATH, "w", encoding="utf-8") as f:
-        json.dump(status, f, indent=2, ensure_ascii=False)
+    save_status(status)
     log("Telegram step complete and status.json updated.")
 
 if __name__ == "__main__":